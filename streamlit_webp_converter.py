@@ -5,22 +5,35 @@ Aplicação Streamlit para converter PNG, JPEG e GIF para WEBP
 """
 
 import streamlit as st
+import hashlib
 import io
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
 import zipfile
-from PIL import Image, ImageSequence
-import base64
-from typing import List, Tuple
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from importlib import metadata
+from pathlib import Path
+from PIL import Image, features
+from typing import Optional, Tuple
 
-# Configuração da página
-st.set_page_config(
-    page_title="Conversor Universal → WEBP",
-    page_icon="🖼️",
-    layout="wide",
-    initial_sidebar_state="expanded"
+from webp_convert import (
+    DEFAULT_LOSSLESS_METHOD,
+    DEFAULT_LOSSY_METHOD,
+    NUMBA_AVAILABLE,
+    PREVIEW_THUMBNAIL_SIZE,
+    convert_image_to_webp,
+    get_file_extension,
+    init_pool_worker,
 )
 
-# CSS personalizado
-st.markdown("""
+# CSS personalizado (aplicado em main())
+CUSTOM_CSS = """
 <style>
     .main-header {
         text-align: center;
@@ -43,270 +56,276 @@ st.markdown("""
         font-weight: bold;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Número máximo de conversões mantidas no cache em memória
+CONVERSION_CACHE_MAX_ENTRIES = 64
+
+# Diretório do cache persistente em disco (sobrevive a novas sessões e
+# reinícios); por padrão fica ao lado do script, não no diretório atual
+DISK_CACHE_DIR = os.environ.get('WEBP_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.webp_cache'))
+
+# Espaço máximo (em MB) ocupado pelo cache em disco; 0 desativa o cache
+try:
+    DISK_CACHE_MAX_BYTES = int(float(os.environ.get('WEBP_CACHE_MAX_MB', '512')) * 1024 * 1024)
+except (ValueError, OverflowError):
+    # Valor inválido (vazio, texto, infinito): usar o padrão em vez de derrubar o app
+    DISK_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Nomes dos arquivos gravados pelo cache em disco (entradas e temporários);
+# qualquer outro arquivo do diretório é ignorado pela poda
+DISK_CACHE_FILE_PATTERN = re.compile(r'^([0-9a-f]{32})\.(?:webp|thumb\.webp|json)(?:\.\d+\.\d+\.tmp)?$')
+
+# Intervalo mínimo (em segundos) entre atualizações da barra de progresso
+PROGRESS_UPDATE_INTERVAL = 0.1
 
-def convert_image_to_webp(image_data: bytes, filename: str, quality: int, lossless: bool) -> Tuple[bytes, dict]:
+# Unidades usadas por format_bytes
+BYTE_UNITS = ('B', 'KB', 'MB', 'GB')
+
+@st.cache_resource
+def get_process_pool() -> ProcessPoolExecutor:
     """
-    Converte uma imagem para WEBP (suporta PNG, JPEG, GIF)
-    
-    Args:
-        image_data: Dados da imagem em bytes
-        filename: Nome do arquivo original
-        quality: Qualidade da compressão (0-100)
-        lossless: Se usar compressão sem perdas
+    Pool de processos compartilhado entre sessões e reruns do Streamlit
     
-    Returns:
-        Tuple com os dados da imagem convertida e estatísticas
+    Os processos não são criados por fork do servidor (multithread), e sim
+    por forkserver (ou spawn onde não existe). Nesse caso o multiprocessing
+    importa este script nos processos como __mp_main__; por isso a interface
+    (inclusive set_page_config e o CSS) fica toda em main(), e eles só pagam
+    os imports.
     """
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=init_pool_worker
+    )
+
+def submit_conversion(*args) -> Future:
+    """Envia uma conversão ao pool, recriando-o se algum processo tiver morrido"""
     try:
-        # Detectar tipo de arquivo
-        file_ext = filename.lower().split('.')[-1]
-        
-        # Tratar GIF (verificar se é animado)
-        if file_ext == 'gif':
-            return convert_gif_to_webp(image_data, filename, quality, lossless)
-        
-        # Abrir imagem
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Converter para modo RGB se necessário
-        if image.mode == 'RGBA':
-            # Preservar transparência para PNG
-            if file_ext == 'png':
-                # Manter RGBA para preservar transparência
+        return get_process_pool().submit(convert_image_to_webp, *args)
+    except BrokenProcessPool:
+        # Um processo encerrado (ex.: falta de memória) inutiliza o pool inteiro
+        get_process_pool.clear()
+        return get_process_pool().submit(convert_image_to_webp, *args)
+
+@st.cache_resource
+def get_conversion_cache() -> Tuple[OrderedDict, threading.Lock]:
+    """Cache LRU das conversões, compartilhado entre sessões e reruns"""
+    return OrderedDict(), threading.Lock()
+
+def get_cache_key(image_data: bytes, file_ext: str, quality: int, lossless: bool, method: int, max_dim: int) -> tuple:
+    """
+    Chave do cache: hash do conteúdo + parâmetros da conversão
+    
+    O nome do arquivo não entra na chave (só a extensão, que define o
+    formato de entrada), então o mesmo conteúdo enviado com outro nome
+    também reaproveita a conversão.
+    """
+    digest = hashlib.blake2b(image_data, digest_size=16).digest()
+    return (digest, file_ext, quality, lossless, method, max_dim)
+
+def prune_disk_cache(cache_dir: Path) -> int:
+    """
+    Apaga as entradas usadas há mais tempo até o cache caber no limite
+    
+    Só considera os arquivos gravados pelo próprio cache: os de uma entrada
+    (e temporários esquecidos) compartilham o hash no início do nome, e a
+    entrada vale pelo tamanho somado e pelo uso mais recente. Retorna o
+    tamanho total ocupado pelo cache.
+    """
+    entries = {}
+    for path in cache_dir.iterdir():
+        match = DISK_CACHE_FILE_PATTERN.match(path.name)
+        if match is None:
+            continue
+        try:
+            file_stat = path.stat()
+        except OSError:
+            continue
+        paths, size, last_used = entries.setdefault(match.group(1), ([], 0, 0.0))
+        paths.append(path)
+        entries[match.group(1)] = (paths, size + file_stat.st_size, max(last_used, file_stat.st_mtime))
+    
+    total_size = sum(size for _, size, _ in entries.values())
+    for paths, size, _ in sorted(entries.values(), key=lambda entry: entry[2]):
+        if total_size <= DISK_CACHE_MAX_BYTES:
+            break
+        for path in paths:
+            try:
+                path.unlink()
+            except OSError:
                 pass
-            else:
-                # Para JPEG, criar fundo branco
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[-1])
-                image = background
-        elif image.mode == 'P':
-            # Converter paleta para RGBA se tiver transparência
-            if 'transparency' in image.info:
-                image = image.convert('RGBA')
-            else:
-                image = image.convert('RGB')
-        elif image.mode not in ('RGB', 'RGBA'):
-            image = image.convert('RGB')
-        
-        # Converter para WEBP
-        output_buffer = io.BytesIO()
-        
-        if lossless:
-            image.save(output_buffer, 'WEBP', lossless=True)
-            compression_type = "Sem perdas"
-        else:
-            if image.mode == 'RGBA':
-                # Para imagens com transparência, usar qualidade ligeiramente mais alta
-                image.save(output_buffer, 'WEBP', quality=min(quality + 5, 100), optimize=True)
-            else:
-                image.save(output_buffer, 'WEBP', quality=quality, optimize=True)
-            compression_type = f"Qualidade {quality}"
-        
-        webp_data = output_buffer.getvalue()
-        
-        # Calcular estatísticas
-        original_size = len(image_data)
-        new_size = len(webp_data)
-        reduction = (1 - new_size / original_size) * 100
-        
-        stats = {
-            'filename': filename,
-            'original_format': file_ext.upper(),
-            'original_size': original_size,
-            'new_size': new_size,
-            'reduction': reduction,
-            'compression_type': compression_type,
-            'dimensions': f"{image.size[0]}x{image.size[1]}",
-            'has_transparency': image.mode == 'RGBA'
-        }
-        
-        return webp_data, stats
-        
-    except Exception as e:
-        st.error(f"Erro ao converter {filename}: {str(e)}")
-        return None, None
+        total_size -= size
+    return total_size
 
-def convert_gif_to_webp(image_data: bytes, filename: str, quality: int, lossless: bool) -> Tuple[bytes, dict]:
+@st.cache_resource
+def get_disk_cache() -> Optional[Tuple[Path, dict, threading.Lock]]:
     """
-    Converte GIF para WEBP (animado se necessário, estático se for GIF estático)
+    Diretório do cache em disco, com o tamanho ocupado e a trava que o protege
+    
+    O diretório é criado e podado uma única vez por servidor; retorna None
+    se o cache estiver desativado ou o diretório não puder ser criado.
     """
+    if DISK_CACHE_MAX_BYTES <= 0:
+        return None
+    cache_dir = Path(DISK_CACHE_DIR)
     try:
-        gif_image = Image.open(io.BytesIO(image_data))
-        
-        # Verificar se é realmente animado
-        is_animated = getattr(gif_image, 'is_animated', False)
-        n_frames = getattr(gif_image, 'n_frames', 1)
-        
-        # Se é GIF animado (mais de 1 frame), converter para WEBP animado
-        if is_animated and n_frames > 1:
-            return convert_animated_gif_to_webp(gif_image, image_data, filename, quality, lossless)
-        else:
-            # GIF estático - converter para WEBP estático normal
-            return convert_static_gif_to_webp(gif_image, image_data, filename, quality, lossless)
-            
-    except Exception as e:
-        st.error(f"Erro ao processar GIF {filename}: {str(e)}")
-        return None, None
+        os.makedirs(cache_dir, exist_ok=True)
+        usage = {'size': prune_disk_cache(cache_dir)}
+    except OSError:
+        return None
+    return cache_dir, usage, threading.Lock()
 
-def convert_static_gif_to_webp(gif_image: Image.Image, image_data: bytes, filename: str, quality: int, lossless: bool) -> Tuple[bytes, dict]:
+def get_disk_cache_paths(key: tuple) -> Optional[Tuple[Path, Path, Path]]:
     """
-    Converte GIF estático para WEBP estático
+    Caminhos do WEBP, da miniatura e das estatísticas de uma chave no cache em disco
+    
+    O nome dos arquivos é o hash hexadecimal da chave completa (conteúdo +
+    parâmetros), então o mesmo arquivo com outras configurações não colide.
     """
+    disk_cache = get_disk_cache()
+    if disk_cache is None:
+        return None
+    cache_dir = disk_cache[0]
+    name = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+    return cache_dir / f"{name}.webp", cache_dir / f"{name}.thumb.webp", cache_dir / f"{name}.json"
+
+def write_file_atomic(path: Path, data: bytes) -> None:
+    """Grava em um arquivo temporário e renomeia, para nunca expor um arquivo pela metade"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
     try:
-        # Converter para RGBA para preservar transparência
-        if gif_image.mode == 'P':
-            if 'transparency' in gif_image.info:
-                gif_image = gif_image.convert('RGBA')
-            else:
-                gif_image = gif_image.convert('RGB')
-        elif gif_image.mode not in ('RGB', 'RGBA'):
-            gif_image = gif_image.convert('RGB')
-        
-        # Salvar como WEBP estático
-        output_buffer = io.BytesIO()
-        
-        if lossless:
-            gif_image.save(output_buffer, 'WEBP', lossless=True)
-            compression_type = "WEBP Estático - Sem perdas"
-        else:
-            gif_image.save(output_buffer, 'WEBP', quality=quality, optimize=True)
-            compression_type = f"WEBP Estático - Qualidade {quality}"
-        
-        webp_data = output_buffer.getvalue()
-        
-        # Calcular estatísticas
-        original_size = len(image_data)
-        new_size = len(webp_data)
-        reduction = (1 - new_size / original_size) * 100
-        
-        stats = {
-            'filename': filename,
-            'original_format': 'GIF',
-            'original_size': original_size,
-            'new_size': new_size,
-            'reduction': reduction,
-            'compression_type': compression_type,
-            'dimensions': f"{gif_image.size[0]}x{gif_image.size[1]}",
-            'has_transparency': gif_image.mode == 'RGBA',
-            'frames': 1,
-            'animated': False,
-            'output_type': 'WEBP Estático'
-        }
-        
-        return webp_data, stats
-        
-    except Exception as e:
-        st.error(f"Erro ao converter GIF estático {filename}: {str(e)}")
-        return None, None
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Não deixar o temporário para trás se a gravação falhar
+        tmp_path.unlink(missing_ok=True)
+        raise
 
-def convert_animated_gif_to_webp(gif_image: Image.Image, image_data: bytes, filename: str, quality: int, lossless: bool) -> Tuple[bytes, dict]:
+def load_disk_conversion(key: tuple) -> Optional[Tuple[bytes, dict]]:
+    """Lê uma conversão do cache em disco, se existir, marcando-a como usada"""
+    paths = get_disk_cache_paths(key)
+    if paths is None:
+        return None
+    webp_path, thumbnail_path, stats_path = paths
+    try:
+        # O .json é gravado por último, então sua presença indica entrada completa
+        stats = json.loads(stats_path.read_text(encoding='utf-8'))
+        webp_data = webp_path.read_bytes()
+        if thumbnail_path.exists():
+            stats['thumbnail'] = thumbnail_path.read_bytes()
+    except (OSError, ValueError):
+        return None
+    # A data de modificação do .json marca o último uso, usado na poda
+    try:
+        os.utime(stats_path)
+    except OSError:
+        pass
+    return webp_data, stats
+
+def save_disk_conversion(key: tuple, result: Tuple[bytes, dict]) -> None:
+    """Grava uma conversão no cache em disco, podando-o se passar do limite (falhas de escrita são ignoradas)"""
+    paths = get_disk_cache_paths(key)
+    if paths is None:
+        return
+    cache_dir, usage, lock = get_disk_cache()
+    webp_path, thumbnail_path, stats_path = paths
+    webp_data, stats = result
+    # A miniatura (bytes) vai em arquivo próprio; o restante é serializável em JSON
+    stats = dict(stats)
+    thumbnail = stats.pop('thumbnail', None)
+    stats_data = json.dumps(stats).encode('utf-8')
+    try:
+        write_file_atomic(webp_path, webp_data)
+        if thumbnail is not None:
+            write_file_atomic(thumbnail_path, thumbnail)
+        write_file_atomic(stats_path, stats_data)
+    except OSError:
+        return
+    
+    # O tamanho é acompanhado em memória; o diretório só é varrido ao estourar o limite
+    with lock:
+        usage['size'] += len(webp_data) + len(thumbnail or b'') + len(stats_data)
+        if usage['size'] > DISK_CACHE_MAX_BYTES:
+            try:
+                usage['size'] = prune_disk_cache(cache_dir)
+            except OSError:
+                pass
+
+def add_to_memory_cache(key: tuple, result: Tuple[bytes, dict]) -> None:
+    """Guarda uma conversão no cache em memória, descartando as menos usadas"""
+    cache, lock = get_conversion_cache()
+    with lock:
+        cache[key] = result
+        cache.move_to_end(key)
+        while len(cache) > CONVERSION_CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+
+def get_cached_conversion(key: tuple, filename: str) -> Optional[Tuple[bytes, dict]]:
     """
-    Converte GIF animado para WEBP animado
+    Retorna a conversão em cache para a chave, se existir, com o nome do arquivo atual
+    
+    Consulta primeiro a memória e depois o disco; um acerto no disco
+    também é trazido para a memória.
     """
-    try:
-        # Extrair todos os frames e durações
-        frames = []
-        durations = []
-        
-        # Iterar por todos os frames
-        for frame_index in range(gif_image.n_frames):
-            gif_image.seek(frame_index)
-            
-            # Copiar o frame atual
-            frame = gif_image.copy()
-            
-            # Converter para RGBA se necessário
-            if frame.mode == 'P':
-                # Se tem transparência, converter para RGBA
-                if 'transparency' in frame.info:
-                    frame = frame.convert('RGBA')
-                else:
-                    frame = frame.convert('RGB')
-            elif frame.mode not in ('RGB', 'RGBA'):
-                frame = frame.convert('RGBA')
-            
-            frames.append(frame)
-            
-            # Obter duração do frame (em milissegundos)
-            duration = frame.info.get('duration', 100)
-            # Garantir duração mínima para evitar animações muito rápidas
-            duration = max(duration, 50)
-            durations.append(duration)
-        
-        # Resetar para o primeiro frame
-        gif_image.seek(0)
-        
-        # Salvar como WEBP animado
-        output_buffer = io.BytesIO()
-        
-        if lossless:
-            frames[0].save(
-                output_buffer,
-                'WEBP',
-                save_all=True,
-                append_images=frames[1:] if len(frames) > 1 else [],
-                duration=durations,
-                loop=0,  # Loop infinito
-                lossless=True,
-                optimize=True
-            )
-            compression_type = "WEBP Animado - Sem perdas"
-        else:
-            frames[0].save(
-                output_buffer,
-                'WEBP',
-                save_all=True,
-                append_images=frames[1:] if len(frames) > 1 else [],
-                duration=durations,
-                loop=0,  # Loop infinito
-                quality=quality,
-                optimize=True
-            )
-            compression_type = f"WEBP Animado - Qualidade {quality}"
-        
-        webp_data = output_buffer.getvalue()
-        
-        # Calcular estatísticas
-        original_size = len(image_data)
-        new_size = len(webp_data)
-        reduction = (1 - new_size / original_size) * 100
-        
-        stats = {
-            'filename': filename,
-            'original_format': 'GIF',
-            'original_size': original_size,
-            'new_size': new_size,
-            'reduction': reduction,
-            'compression_type': compression_type,
-            'dimensions': f"{gif_image.size[0]}x{gif_image.size[1]}",
-            'has_transparency': any(frame.mode == 'RGBA' for frame in frames),
-            'frames': len(frames),
-            'animated': True,
-            'output_type': 'WEBP Animado'
-        }
-        
-        return webp_data, stats
-        
-    except Exception as e:
-        st.error(f"Erro ao converter GIF animado {filename}: {str(e)}")
-        return None, None
+    cache, lock = get_conversion_cache()
+    with lock:
+        result = cache.get(key)
+        if result is not None:
+            cache.move_to_end(key)
+    if result is None:
+        result = load_disk_conversion(key)
+        if result is None:
+            return None
+        add_to_memory_cache(key, result)
+    webp_data, stats = result
+    return webp_data, {**stats, 'filename': filename}
+
+def store_conversion(key: tuple, result: Tuple[bytes, dict]) -> None:
+    """Guarda uma conversão nos caches em memória e em disco"""
+    add_to_memory_cache(key, result)
+    save_disk_conversion(key, result)
 
-def create_download_link(data: bytes, filename: str, text: str) -> str:
-    """Cria um link de download para os dados"""
-    b64_data = base64.b64encode(data).decode()
-    href = f'<a href="data:application/octet-stream;base64,{b64_data}" download="{filename}">{text}</a>'
-    return href
+def create_thumbnail(image_data: bytes, size: int) -> Image.Image:
+    """Cria uma miniatura para preview (JPEGs usam decodificação reduzida)"""
+    thumbnail = Image.open(io.BytesIO(image_data))
+    thumbnail.thumbnail((size, size))
+    return thumbnail
+
+@st.cache_resource
+def get_image_backend_info() -> dict:
+    """Informações sobre o build do Pillow em uso (SIMD, libjpeg-turbo, libwebp)"""
+    try:
+        pillow_simd = metadata.version('pillow-simd')
+    except metadata.PackageNotFoundError:
+        pillow_simd = None
+    
+    return {
+        'pillow_simd': pillow_simd,
+        'libjpeg_turbo': features.check_feature('libjpeg_turbo'),
+        'libwebp': features.version_module('webp'),
+        'numba': NUMBA_AVAILABLE,
+        'workers': os.cpu_count()
+    }
 
 def format_bytes(bytes_value: int) -> str:
     """Formata bytes em unidades legíveis"""
-    for unit in ['B', 'KB', 'MB']:
-        if bytes_value < 1024.0:
-            return f"{bytes_value:.1f} {unit}"
-        bytes_value /= 1024.0
-    return f"{bytes_value:.1f} GB"
+    # Cada unidade corresponde a 10 bits (1024), então bit_length() escolhe a unidade
+    index = min((max(bytes_value, 1).bit_length() - 1) // 10, len(BYTE_UNITS) - 1)
+    return f"{bytes_value / (1 << (index * 10)):.1f} {BYTE_UNITS[index]}"
 
 def main():
+    # Configuração da página
+    st.set_page_config(
+        page_title="Conversor Universal → WEBP",
+        page_icon="🖼️",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
+    # CSS personalizado
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+    
     # Título principal
     st.markdown('<h1 class="main-header">🖼️ Conversor Universal → WEBP</h1><h2><b>PMCs Softexpert</b></h2>', unsafe_allow_html=True)
     
@@ -326,6 +345,22 @@ def main():
     else:
         quality = 100
     
+    # Esforço do encoder (velocidade x tamanho do arquivo)
+    method = st.sidebar.slider(
+        "Esforço do encoder (0 = rápido, 6 = menor arquivo):",
+        0, 6,
+        DEFAULT_LOSSLESS_METHOD if lossless else DEFAULT_LOSSY_METHOD,
+        help="Valores maiores geram arquivos um pouco menores, mas demoram mais"
+    )
+    
+    # Redimensionamento opcional
+    max_dim = st.sidebar.selectbox(
+        "Dimensão máxima:",
+        [0, 3840, 2560, 1920, 1280, 1024, 800, 640],
+        format_func=lambda value: "Original" if value == 0 else f"{value} px",
+        help="Reduz imagens maiores que o limite, mantendo a proporção"
+    )
+    
     # Informações sobre formatos suportados
     with st.sidebar.expander("📁 Formatos Suportados"):
         st.write("""
@@ -371,6 +406,19 @@ def main():
         - ✅ **Suporte nativo** em navegadores modernos
         """)
     
+    # Informações sobre o build de processamento de imagens
+    with st.sidebar.expander("⚡ Desempenho"):
+        backend = get_image_backend_info()
+        st.write(f"""
+        - 🚀 **Pillow-SIMD:** {backend['pillow_simd'] or "não (Pillow padrão)"}
+        - 📷 **libjpeg-turbo:** {"sim" if backend['libjpeg_turbo'] else "não"}
+        - 🖼️ **libwebp:** {backend['libwebp'] or "indisponível"}
+        - 🧮 **Numba (composição JIT):** {"sim" if backend['numba'] else "não"}
+        - ⚙️ **Processos de conversão:** {backend['workers']}
+        
+        Use a imagem Docker do projeto para o build com AVX2.
+        """)
+    
     # Upload de arquivos
     st.header("📁 Enviar Imagens")
     uploaded_files = st.file_uploader(
@@ -381,10 +429,15 @@ def main():
     )
     
     if uploaded_files:
+        # Ler os bytes de cada arquivo uma única vez (preview e conversão).
+        # getvalue() devolve o próprio objeto bytes do upload, sem cópia; um
+        # memoryview de getbuffer() não poderia ser enviado ao pool (pickle)
+        files_data = [file.getvalue() for file in uploaded_files]
+        files_ext = [get_file_extension(file.name) for file in uploaded_files]
+        
         # Mostrar tipos de arquivo detectados
         file_types = {}
-        for file in uploaded_files:
-            ext = file.name.lower().split('.')[-1]
+        for ext in files_ext:
             if ext == 'jpg':
                 ext = 'jpeg'
             file_types[ext.upper()] = file_types.get(ext.upper(), 0) + 1
@@ -398,8 +451,11 @@ def main():
             for i, file in enumerate(uploaded_files):
                 with cols[i % 4]:
                     try:
-                        if file.type.startswith('image'):
-                            st.image(file, caption=file.name, width=150)
+                        if files_ext[i] == 'gif':
+                            # Manter a animação do GIF no preview
+                            st.image(files_data[i], caption=file.name, width=150)
+                        elif file.type.startswith('image'):
+                            st.image(create_thumbnail(files_data[i], 150), caption=file.name, width=150)
                         else:
                             st.write(f"📁 {file.name}")
                     except:
@@ -417,24 +473,56 @@ def main():
             total_original_size = 0
             total_new_size = 0
             
-            # Processar cada arquivo
+            # Reaproveitar conversões em cache e enviar o resto ao pool de processos
+            results = [None] * len(uploaded_files)
+            futures = {}
             for i, uploaded_file in enumerate(uploaded_files):
-                file_ext = uploaded_file.name.lower().split('.')[-1]
-                status_text.text(f"Convertendo {file_ext.upper()}: {uploaded_file.name}")
-                progress_bar.progress((i + 1) / len(uploaded_files))
+                file_data = files_data[i]
+                cache_key = get_cache_key(file_data, files_ext[i], quality, lossless, method, max_dim)
                 
-                # Ler dados do arquivo
-                file_data = uploaded_file.read()
-                
-                # Converter
-                webp_data, stats = convert_image_to_webp(
-                    file_data, 
-                    uploaded_file.name, 
-                    quality, 
-                    lossless
-                )
+                cached = get_cached_conversion(cache_key, uploaded_file.name)
+                if cached is not None:
+                    results[i] = cached
+                else:
+                    future = submit_conversion(
+                        file_data,
+                        uploaded_file.name,
+                        quality,
+                        lossless,
+                        method,
+                        max_dim,
+                        files_ext[i]
+                    )
+                    futures[future] = (i, cache_key)
+            
+            # Atualizar o progresso à medida que as conversões terminam, no
+            # máximo a cada PROGRESS_UPDATE_INTERVAL para poupar o websocket
+            done = len(uploaded_files) - len(futures)
+            last_update = 0.0
+            for future in as_completed(futures):
+                i, cache_key = futures[future]
+                try:
+                    results[i] = future.result()
+                except BrokenProcessPool:
+                    results[i] = (None, f"Erro ao converter {uploaded_files[i].name}: o processo de conversão foi encerrado inesperadamente")
+                except Exception as e:
+                    # Falhas do próprio pool (ex.: pickle) afetam só este arquivo
+                    results[i] = (None, f"Erro ao converter {uploaded_files[i].name}: {str(e)}")
+                if results[i][0] is not None:
+                    store_conversion(cache_key, results[i])
                 
-                if webp_data and stats:
+                done += 1
+                now = time.monotonic()
+                if now - last_update >= PROGRESS_UPDATE_INTERVAL or done == len(uploaded_files):
+                    status_text.text(f"Convertido {files_ext[i].upper()}: {uploaded_files[i].name}")
+                    progress_bar.progress(done / len(uploaded_files))
+                    last_update = now
+            
+            # Processar os resultados na ordem de envio
+            for uploaded_file, (webp_data, stats) in zip(uploaded_files, results):
+                if webp_data is None:
+                    st.error(stats)
+                else:
                     # Nome do arquivo convertido
                     webp_filename = uploaded_file.name.rsplit('.', 1)[0] + '.webp'
                     
@@ -466,30 +554,32 @@ def main():
                 # Tabela com detalhes de cada arquivo
                 st.header("📊 Detalhes da Conversão")
                 
-                stats_data = []
-                for stats in all_stats:
-                    row = {
-                        "Arquivo": stats['filename'],
-                        "Formato": stats['original_format'],
-                        "Dimensões": stats['dimensions'],
-                        "Tamanho Original": format_bytes(stats['original_size']),
-                        "Tamanho WEBP": format_bytes(stats['new_size']),
-                        "Redução": f"{stats['reduction']:.1f}%",
-                        "Compressão": stats['compression_type']
-                    }
-                    
-                    # Adicionar informações específicas para GIFs
-                    if 'frames' in stats:
-                        row["Frames"] = stats['frames']
-                        row["Animado"] = "Sim" if stats.get('animated', False) else "Não"
-                        if 'output_type' in stats:
-                            row["Tipo Saída"] = stats['output_type']
-                    
-                    # Adicionar informação sobre transparência
-                    if stats.get('has_transparency'):
-                        row["Transparência"] = "Sim"
-                    
-                    stats_data.append(row)
+                # Montar a tabela por colunas (formato nativo do DataFrame)
+                stats_data = {
+                    "Arquivo": [stats['filename'] for stats in all_stats],
+                    "Formato": [stats['original_format'] for stats in all_stats],
+                    "Dimensões": [stats['dimensions'] for stats in all_stats],
+                    "Tamanho Original": [format_bytes(stats['original_size']) for stats in all_stats],
+                    "Tamanho WEBP": [format_bytes(stats['new_size']) for stats in all_stats],
+                    "Redução": [f"{stats['reduction']:.1f}%" for stats in all_stats],
+                    "Compressão": [stats['compression_type'] for stats in all_stats]
+                }
+                
+                # Adicionar informações específicas para GIFs
+                if any('frames' in stats for stats in all_stats):
+                    stats_data["Frames"] = [stats.get('frames') for stats in all_stats]
+                    stats_data["Animado"] = [
+                        ("Sim" if stats.get('animated', False) else "Não") if 'frames' in stats else None
+                        for stats in all_stats
+                    ]
+                    stats_data["Tipo Saída"] = [stats.get('output_type') for stats in all_stats]
+                
+                # Adicionar informação sobre transparência
+                if any(stats.get('has_transparency') for stats in all_stats):
+                    stats_data["Transparência"] = [
+                        "Sim" if stats.get('has_transparency') else None
+                        for stats in all_stats
+                    ]
                 
                 st.dataframe(stats_data, use_container_width=True)
                 
@@ -506,9 +596,12 @@ def main():
                         mime="image/webp"
                     )
                 else:
-                    # Download em ZIP
+                    # Download em ZIP (sem recompressão: WEBP já é comprimido).
+                    # O ZIP fica em memória de propósito: st.download_button lê
+                    # todo o conteúdo para o gerenciador de mídia do Streamlit,
+                    # então um arquivo temporário em disco não reduziria a RAM
                     zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_STORED) as zip_file:
                         for webp_data, webp_filename in converted_files:
                             zip_file.writestr(webp_filename, webp_data)
                     
@@ -522,9 +615,12 @@ def main():
                 # Preview das imagens convertidas
                 with st.expander("🔍 Visualizar Imagens Convertidas"):
                     cols = st.columns(min(3, len(converted_files)))
-                    for i, (webp_data, webp_filename) in enumerate(converted_files):
+                    for i, ((webp_data, webp_filename), stats) in enumerate(zip(converted_files, all_stats)):
                         with cols[i % 3]:
-                            st.image(webp_data, caption=webp_filename, width=200)
+                            # Miniatura gerada na conversão; WEBPs animados são exibidos
+                            # diretamente para manter a animação
+                            preview = stats.get('thumbnail', webp_data)
+                            st.image(preview, caption=webp_filename, width=PREVIEW_THUMBNAIL_SIZE)
     
     else:
         # Instruções quando não há arquivos
@@ -0,0 +1,346 @@
+"""
+Conversão de imagens para WEBP
+
+Funções executadas nos processos do pool de conversão. Ficam fora do script
+do Streamlit porque ele é reexecutado como __main__ a cada rerun: o pool
+referencia as funções pelo módulo ao enviá-las, e só um módulo importável
+mantém essa referência estável.
+"""
+
+import gc
+import io
+from functools import lru_cache
+from importlib.util import find_spec
+import numpy as np
+from PIL import Image, ImageChops, ImageSequence
+from contextlib import contextmanager
+from typing import Optional, Tuple, Union
+
+# Numba é opcional: sem ele, a composição sobre fundo branco usa NumPy. A
+# disponibilidade é verificada sem importá-lo, pois o import custa ~100 MB
+# de memória por processo
+NUMBA_AVAILABLE = find_spec('numba') is not None
+
+# Esforço padrão do encoder WEBP (0 = mais rápido, 6 = menor arquivo)
+DEFAULT_LOSSY_METHOD = 2
+DEFAULT_LOSSLESS_METHOD = 4
+
+# Lado máximo (em pixels) das miniaturas de preview das imagens convertidas
+PREVIEW_THUMBNAIL_SIZE = 200
+
+def get_file_extension(filename: str) -> str:
+    """Retorna a extensão do arquivo em minúsculas, sem o ponto"""
+    return filename.rpartition('.')[2].lower()
+
+def encode_webp(image: Image.Image, **save_params) -> bytes:
+    """
+    Codifica uma imagem em WEBP e retorna os bytes
+    
+    O buffer não é pré-alocado: o plugin WEBP do Pillow grava o resultado
+    numa única escrita e getvalue() devolve o buffer interno sem copiar.
+    """
+    output_buffer = io.BytesIO()
+    image.save(output_buffer, 'WEBP', **save_params)
+    return output_buffer.getvalue()
+
+def blend_on_white(rgba: np.ndarray, rgb: np.ndarray) -> None:
+    """Kernel da composição sobre branco, pixel a pixel (compilado pelo Numba)"""
+    height, width = rgba.shape[0], rgba.shape[1]
+    for y in range(height):
+        for x in range(width):
+            alpha = np.uint16(rgba[y, x, 3])
+            white = 255 * (255 - alpha) + 127
+            for channel in range(3):
+                rgb[y, x, channel] = (rgba[y, x, channel] * alpha + white) // 255
+
+@lru_cache(maxsize=None)
+def get_blend_kernel():
+    """
+    Compila blend_on_white com o Numba na primeira chamada; None sem Numba
+    
+    Só imagens RGBA que não são PNG/GIF passam pela composição (na prática,
+    raras), então o Numba é importado apenas quando uma delas aparece.
+    """
+    if not NUMBA_AVAILABLE:
+        return None
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+    return njit(cache=True, nogil=True)(blend_on_white)
+
+def composite_on_white(image: Image.Image) -> Image.Image:
+    """Aplica uma imagem RGBA sobre fundo branco, numa única passada vetorizada"""
+    rgba = np.asarray(image)
+    rgb = np.empty(rgba.shape[:2] + (3,), dtype=np.uint8)
+    
+    # Com Numba, uma única passada sem arrays intermediários
+    blend_kernel = get_blend_kernel()
+    if blend_kernel is not None:
+        blend_kernel(rgba, rgb)
+        return Image.fromarray(rgb)
+    
+    alpha = rgba[..., 3].astype(np.uint16)
+    # Parcela do branco, já com o arredondamento: 255 * (255 - a) + 127
+    white = 255 * (255 - alpha) + 127
+    
+    # Mistura canal a canal, reaproveitando um único buffer intermediário:
+    # (cor * a + 255 * (255 - a) + 127) // 255 cabe em uint16
+    blended = np.empty(alpha.shape, dtype=np.uint16)
+    for channel in range(3):
+        np.multiply(rgba[..., channel], alpha, out=blended)
+        blended += white
+        blended //= 255
+        rgb[..., channel] = blended
+    return Image.fromarray(rgb)
+
+@contextmanager
+def gc_paused():
+    """
+    Pausa o coletor de lixo cíclico durante um trecho com muitas alocações
+    
+    Usado só nos processos do pool, que têm uma única thread e fazem uma
+    conversão por vez; os frames descartados são liberados pela contagem de
+    referências, então não é preciso uma coleta ao final.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+def init_pool_worker() -> None:
+    """
+    Prepara cada processo do pool antes da primeira conversão
+    
+    Registra os plugins do Pillow e carrega o codec WEBP codificando uma
+    imagem 1x1, para que a primeira conversão de cada processo não pague
+    esse custo. O kernel do Numba não é aquecido aqui: ele só é carregado
+    se alguma conversão precisar da composição sobre fundo branco.
+    """
+    encode_webp(Image.new('RGB', (1, 1)))
+    # Objetos da inicialização vivem até o fim do processo: tirá-los das
+    # coletas deixa cada passada do coletor mais curta
+    gc.freeze()
+
+def convert_image_to_webp(image_data: bytes, filename: str, quality: int, lossless: bool, method: int = DEFAULT_LOSSY_METHOD, max_dim: int = 0, file_ext: Optional[str] = None) -> Tuple[Optional[bytes], Union[dict, str]]:
+    """
+    Converte uma imagem para WEBP (suporta PNG, JPEG, GIF)
+    
+    Args:
+        image_data: Dados da imagem em bytes
+        filename: Nome do arquivo original
+        quality: Qualidade da compressão (0-100)
+        lossless: Se usar compressão sem perdas
+        method: Esforço do encoder WEBP (0 = mais rápido, 6 = menor arquivo)
+        max_dim: Dimensão máxima (largura/altura) da saída; 0 mantém o tamanho
+        file_ext: Extensão já calculada pelo chamador; obtida do nome se omitida
+    
+    Returns:
+        Tuple com os dados da imagem convertida e estatísticas, ou
+        (None, mensagem de erro) se a conversão falhar. Não chama a API do
+        Streamlit, pois roda nos processos do pool de conversão.
+    """
+    try:
+        # Detectar tipo de arquivo
+        if file_ext is None:
+            file_ext = get_file_extension(filename)
+        
+        # Tratar GIF (verificar se é animado)
+        if file_ext == 'gif':
+            return convert_gif_to_webp(image_data, filename, quality, lossless, method, max_dim)
+        
+        # Abrir imagem
+        image = Image.open(io.BytesIO(image_data))
+        
+        # Para JPEG, reduzir já na decodificação (IDCT em escala 1/2, 1/4 ou 1/8)
+        if max_dim and file_ext in ('jpg', 'jpeg'):
+            image.draft('RGB', (max_dim, max_dim))
+        
+        # Converter para modo RGB se necessário
+        if image.mode == 'RGBA':
+            # Preservar transparência para PNG
+            if file_ext == 'png':
+                # Manter RGBA para preservar transparência
+                pass
+            else:
+                # Para JPEG, aplicar sobre fundo branco
+                image = composite_on_white(image)
+        elif image.mode == 'P':
+            # Converter paleta para RGBA se tiver transparência
+            if 'transparency' in image.info:
+                image = image.convert('RGBA')
+            else:
+                image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+        
+        # Redimensionar mantendo a proporção, se necessário
+        if max_dim:
+            image.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+        
+        # Converter para WEBP
+        if lossless:
+            webp_data = encode_webp(image, lossless=True, method=method)
+            compression_type = f"Sem perdas (esforço {method})"
+        else:
+            if image.mode == 'RGBA':
+                # Para imagens com transparência, usar qualidade ligeiramente mais alta
+                webp_data = encode_webp(image, quality=min(quality + 5, 100), method=method)
+            else:
+                webp_data = encode_webp(image, quality=quality, method=method)
+            compression_type = f"Qualidade {quality} (esforço {method})"
+        
+        # Calcular estatísticas
+        original_size = len(image_data)
+        new_size = len(webp_data)
+        reduction = (1 - new_size / original_size) * 100
+        
+        stats = {
+            'filename': filename,
+            'original_format': file_ext.upper(),
+            'original_size': original_size,
+            'new_size': new_size,
+            'reduction': reduction,
+            'compression_type': compression_type,
+            'dimensions': f"{image.size[0]}x{image.size[1]}",
+            'has_transparency': image.mode == 'RGBA',
+            'thumbnail': create_webp_thumbnail(image, PREVIEW_THUMBNAIL_SIZE)
+        }
+        
+        return webp_data, stats
+        
+    except Exception as e:
+        return None, f"Erro ao converter {filename}: {str(e)}"
+
+def normalize_gif_frame(frame: Image.Image) -> Image.Image:
+    """Converte um frame de GIF para RGB/RGBA, preservando a transparência"""
+    if frame.mode in ('RGB', 'RGBA'):
+        return frame
+    # Só usar RGBA se houver transparência; frames opacos seguem em RGB,
+    # evitando que o libwebp codifique um canal alfa inútil
+    if 'transparency' in frame.info or 'A' in frame.mode:
+        return frame.convert('RGBA')
+    return frame.convert('RGB')
+
+def is_same_frame(previous: Image.Image, frame: Image.Image) -> bool:
+    """Verifica se dois frames já compostos têm exatamente os mesmos pixels"""
+    if previous.mode != frame.mode or previous.size != frame.size:
+        return False
+    return all(high == 0 for _, high in ImageChops.difference(previous, frame).getextrema())
+
+@gc_paused()
+def convert_gif_to_webp(image_data: bytes, filename: str, quality: int, lossless: bool, method: int = DEFAULT_LOSSY_METHOD, max_dim: int = 0) -> Tuple[Optional[bytes], Union[dict, str]]:
+    """
+    Converte GIF para WEBP (animado se necessário, estático se for GIF estático)
+    
+    O GIF é aberto e decodificado uma única vez; GIFs com mais de um frame
+    viram WEBP animado, os demais viram WEBP estático.
+    """
+    try:
+        gif_image = Image.open(io.BytesIO(image_data))
+        
+        # Verificar se é realmente animado (mais de 1 frame)
+        n_frames = getattr(gif_image, 'n_frames', 1)
+        is_animated = n_frames > 1
+        
+        # Extrair frames e durações
+        frames = []
+        durations = []
+        
+        if is_animated:
+            # O iterador reaproveita o mesmo objeto, então cada frame guardado
+            # precisa ser uma imagem própria
+            for frame in ImageSequence.Iterator(gif_image):
+                # convert() já devolve uma imagem nova, dispensando o copy()
+                normalized = normalize_gif_frame(frame)
+                if max_dim:
+                    if normalized is frame:
+                        normalized = frame.copy()
+                    normalized.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+                
+                # Obter duração do frame (em milissegundos)
+                duration = frame.info.get('duration', 100)
+                # Garantir duração mínima para evitar animações muito rápidas
+                duration = max(duration, 50)
+                
+                # Frames repetidos (pausas na animação) não são guardados de
+                # novo: o frame anterior passa a durar mais
+                if frames and is_same_frame(frames[-1], normalized):
+                    durations[-1] += duration
+                    continue
+                
+                if normalized is frame:
+                    normalized = frame.copy()
+                frames.append(normalized)
+                durations.append(duration)
+            output_type = 'WEBP Animado'
+        else:
+            frame = normalize_gif_frame(gif_image)
+            if max_dim:
+                frame.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+            frames.append(frame)
+            output_type = 'WEBP Estático'
+        
+        # Parâmetros de compressão
+        if lossless:
+            save_params = {'lossless': True, 'method': method}
+            compression_type = f"{output_type} - Sem perdas (esforço {method})"
+        else:
+            save_params = {'quality': quality, 'method': method}
+            compression_type = f"{output_type} - Qualidade {quality} (esforço {method})"
+        
+        # Salvar como WEBP
+        if is_animated:
+            webp_data = encode_webp(
+                frames[0],
+                save_all=True,
+                append_images=frames[1:],
+                duration=durations,
+                loop=0,  # Loop infinito
+                **save_params
+            )
+        else:
+            webp_data = encode_webp(frames[0], **save_params)
+        
+        # Calcular estatísticas
+        original_size = len(image_data)
+        new_size = len(webp_data)
+        reduction = (1 - new_size / original_size) * 100
+        
+        stats = {
+            'filename': filename,
+            'original_format': 'GIF',
+            'original_size': original_size,
+            'new_size': new_size,
+            'reduction': reduction,
+            'compression_type': compression_type,
+            'dimensions': f"{frames[0].size[0]}x{frames[0].size[1]}",
+            'has_transparency': any(frame.mode == 'RGBA' for frame in frames),
+            'frames': n_frames,
+            'animated': is_animated,
+            'output_type': output_type
+        }
+        
+        # GIFs animados usam o próprio WEBP no preview, para manter a animação
+        if not is_animated:
+            stats['thumbnail'] = create_webp_thumbnail(frames[0], PREVIEW_THUMBNAIL_SIZE)
+        
+        return webp_data, stats
+        
+    except Exception as e:
+        return None, f"Erro ao converter GIF {filename}: {str(e)}"
+
+def create_webp_thumbnail(image: Image.Image, size: int) -> bytes:
+    """
+    Cria uma miniatura WEBP leve para o preview das imagens convertidas
+    
+    Parte da imagem já decodificada durante a conversão, evitando decodificar
+    de novo o WEBP final só para exibi-lo em tamanho reduzido.
+    """
+    scale = min(size / image.size[0], size / image.size[1], 1)
+    thumbnail_size = (max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale)))
+    thumbnail = image.resize(thumbnail_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return encode_webp(thumbnail, quality=70, method=0)